@@ -7,24 +7,35 @@ Supports multiple models: Qwen3-VL, LLaVA.
 
 import os
 import json
+import math
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 import base64
+import concurrent.futures
+import hashlib
+import io
+import mmap
+import sqlite3
 import argparse
+import asyncio
 import sys
+import time
 
 try:
-    from PIL import Image
-    from PIL.ExifTags import TAGS, GPSTAGS
-    import requests
+    from PIL import Image, ImageOps
+    from PIL.ExifTags import GPSTAGS, Base, IFD
+    import httpx
+    import orjson
 except ImportError:
     print("Installing required dependencies...")
     import subprocess
-    subprocess.run(["pip", "install", "pillow", "requests", "--break-system-packages"], check=True)
-    from PIL import Image
-    from PIL.ExifTags import TAGS, GPSTAGS
-    import requests
+    subprocess.run(["pip", "install", "pillow", "httpx", "orjson", "--break-system-packages"], check=True)
+    from PIL import Image, ImageOps
+    from PIL.ExifTags import GPSTAGS, Base, IFD
+    import httpx
+    import orjson
 
 # Configuration with relative paths
 SCRIPT_DIR = Path(__file__).parent
@@ -78,8 +89,100 @@ Format: tag1, tag2, tag3, tag4""",
 # Default model
 DEFAULT_MODEL = "qwen3-vl:8b"
 
+# EXIF tags extracted from the photos (camera, lens, settings, date, dimensions).
+# Tags of the main IFD and of the Exif sub-IFD are read separately.
+EXIF_MAIN_TAGS = [Base.Make, Base.Model, Base.DateTime, Base.Orientation]
+EXIF_SUB_TAGS = [
+    Base.DateTimeOriginal, Base.ExposureTime, Base.FNumber, Base.ISOSpeedRatings,
+    Base.FocalLength, Base.LensModel, Base.ExifImageWidth, Base.ExifImageHeight,
+]
+
+# Maximum number of concurrent requests sent to Ollama
+# (should match the server's OLLAMA_NUM_PARALLEL setting; the server's
+# 0 = "auto" is not meaningful here, so values below 1 are raised to 1)
+OLLAMA_NUM_PARALLEL = max(1, int(os.environ.get("OLLAMA_NUM_PARALLEL", "4")))
+
+# Prefix asking models that support it (Qwen) not to show their reasoning
+NO_THINKING_PREFIX = "Answer directly without showing your reasoning process. "
+
+# How long Ollama keeps the model loaded after the last request
+OLLAMA_KEEP_ALIVE = "30m"
+
+# Retry policy for transient Ollama errors (rate limiting, 5xx, timeouts)
+RETRY_ATTEMPTS = 3
+RETRY_BASE_WAIT = 2
+RETRY_MAX_WAIT = 10
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Long edge (pixels) images are downscaled to before being sent to the model
+IMAGE_MAX_EDGE = 1280
+
+# Number of encoded images kept in memory (least recently used are dropped)
+IMAGE_MEMO_SIZE = 64
+
+# Number of images encoded ahead of the one currently requested
+# (kept well below IMAGE_MEMO_SIZE so prefetching doesn't evict images in use)
+PREFETCH_WINDOW = min(2 * OLLAMA_NUM_PARALLEL, IMAGE_MEMO_SIZE // 2)
+
+# Maximum number of images sent together in a single group analysis request
+GROUP_MAX_IMAGES = 4
+
+def create_client() -> httpx.AsyncClient:
+    """Creates the HTTP client used for Ollama requests
+
+    The keep-alive connection pool lets requests reuse sockets instead of
+    opening a new TCP connection each time.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_keepalive_connections=40, max_connections=100, keepalive_expiry=30)
+    )
+
+async def _read_chat_stream(response: httpx.Response) -> str:
+    """Accumulates the message content of a streamed chat response
+
+    Ollama sends one JSON object per line, each carrying the next chunk of
+    the message content.
+    """
+    content = []
+    async for line in response.aiter_lines():
+        if not line:
+            continue
+        chunk = orjson.loads(line)
+        if 'message' not in chunk or 'content' not in chunk['message']:
+            raise ValueError(f'Unexpected response format: {chunk}')
+        content.append(chunk['message']['content'])
+    return ''.join(content)
+
+def _encode_file(path_str: str) -> str:
+    """Returns the file contents base64 encoded
+
+    The file is memory-mapped rather than read into a bytes copy before encoding.
+    """
+    with open(path_str, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return base64.b64encode(mm).decode('ascii')
+
+def _prepare_image_bytes(path_str: str, max_edge: int = IMAGE_MAX_EDGE) -> str:
+    """Returns the image base64 encoded, downscaled so its long edge is at most max_edge
+
+    Images already small enough are sent unchanged; larger ones are
+    resized (honouring the EXIF orientation) and re-encoded as JPEG.
+    """
+    with Image.open(path_str) as image:
+        if max(image.size) <= max_edge:
+            return _encode_file(path_str)
+        
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=90)
+    return base64.b64encode(buffer.getbuffer()).decode('ascii')
+
 class PhotoAnalyzer:
-    def __init__(self, photo_dir: str, results_dir: str, model_name: str = None):
+    def __init__(self, photo_dir: str, results_dir: str, model_name: str = None, rps: float = None,
+                 client: httpx.AsyncClient = None, use_cache: bool = True, model_digest: str = ""):
         self.photo_dir = Path(photo_dir)
         self.results_dir = Path(results_dir)
         self.results_dir.mkdir(parents=True, exist_ok=True)
@@ -92,12 +195,120 @@ class PhotoAnalyzer:
             available = ", ".join(MODEL_CONFIGS.keys())
             raise ValueError(f"Model '{model_name}' not recognized. Available: {available}")
         
+        if rps is not None and not (math.isfinite(rps) and rps > 0):
+            raise ValueError(f"Requests per second must be a finite number greater than 0 (got {rps})")
+        
         self.model_config = MODEL_CONFIGS[model_name]
         self.model_name = self.model_config["name"]
+        self.model_safe_name = self.model_name.replace(':', '_').replace('/', '_')
         print(f"Using model: {self.model_name} - {self.model_config['description']}")
         
+        # Final prompt content for each (prompt_type, use_thinking), resolved once
+        self._no_thinking_prefix = NO_THINKING_PREFIX if "qwen" in self.model_name.lower() else ""
+        self._effective_prompts: Dict[Tuple[str, bool], str] = {
+            (prompt_type, use_thinking): self._apply_thinking_mode(prompt, use_thinking)
+            for prompt_type, prompt in self.model_config["prompts"].items()
+            for use_thinking in (False, True)
+        }
+        
+        # Cache of successful responses, keyed on model (name and digest), options,
+        # prompt and image content. With use_cache=False cached responses are
+        # ignored, but fresh ones are still stored.
+        self.model_digest = model_digest
+        self.use_cache = use_cache
+        self.cache_path = self.results_dir / "cache.sqlite"
+        self._cache = self._open_cache()
+        
+        # Images are resized and encoded in worker processes (CPU-bound work
+        # that would otherwise block the event loop); the resulting futures
+        # are memoized on (path, mtime) in a bounded LRU, and the next images
+        # of the run are encoded ahead of time
+        self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count())
+        self._encoded_images: "OrderedDict[tuple, asyncio.Future]" = OrderedDict()
+        self._prefetch_order: List[Path] = []
+        self._prefetch_index: Dict[Path, int] = {}
+        
+        # Parsed EXIF metadata, keyed on (path, mtime)
+        self._exif_cache: Dict[tuple, Dict[str, Any]] = {}
+        
+        # Shared HTTP client (owned by the analyzer unless passed in)
+        self._owns_client = client is None
+        self.client = client if client is not None else create_client()
+        
+        # Limit on concurrent requests sent to Ollama
+        self.sem = asyncio.Semaphore(OLLAMA_NUM_PARALLEL)
+        
+        # Optional limit on requests per second (minimum interval between dispatches)
+        self._min_interval = 1.0 / rps if rps is not None else 0.0
+        self._last_dispatch = 0.0
+        self._rate_lock = asyncio.Lock()
+        
+    def _open_cache(self) -> sqlite3.Connection:
+        """Opens the SQLite response cache, creating it if needed
+        
+        The cache is shared by all models and persists across runs; WAL mode
+        allows concurrent readers (e.g. runs comparing different models).
+        """
+        conn = sqlite3.connect(self.cache_path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache(key TEXT PRIMARY KEY, response TEXT)")
+        return conn
+    
+    def _cache_get(self, key: str) -> Dict[str, Any]:
+        """Returns the cached analysis for the key, or None"""
+        if not self.use_cache:
+            return None
+        row = self._cache.execute("SELECT response FROM cache WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def _cache_put(self, key: str, analysis: Dict[str, Any]):
+        """Stores an analysis in the cache"""
+        self._cache.execute(
+            "INSERT OR REPLACE INTO cache(key, response) VALUES (?, ?)",
+            (key, json.dumps(analysis, ensure_ascii=False))
+        )
+    
+    async def aclose(self):
+        """Closes the response cache and the HTTP client (if owned) and stops the worker processes"""
+        self._cache.close()
+        if self._owns_client:
+            await self.client.aclose()
+        self._pool.shutdown(cancel_futures=True)
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+    
+    def _apply_thinking_mode(self, prompt: str, use_thinking: bool) -> str:
+        """Returns the prompt content to send, with the no-thinking prefix if needed"""
+        # If we don't want thinking mode, specify it in the prompt (only for some models)
+        return prompt if use_thinking else self._no_thinking_prefix + prompt
+    
+    async def warmup(self):
+        """Loads the model into memory, so its load time doesn't land on the first analyzed image"""
+        print(f"Loading model {self.model_name}...")
+        try:
+            # A request without prompt only loads the model
+            response = await self.client.post(
+                'http://localhost:11434/api/generate',
+                json={"model": self.model_name, "keep_alive": OLLAMA_KEEP_ALIVE, "stream": False},
+                timeout=120
+            )
+            if response.status_code != 200:
+                print(f"WARNING: Model warmup failed (HTTP {response.status_code})")
+        except httpx.HTTPError as e:
+            print(f"WARNING: Model warmup failed: {e}")
+    
     def extract_exif(self, image_path: Path) -> Dict[str, Any]:
-        """Extracts EXIF metadata from the photo"""
+        """Extracts EXIF metadata from the photo (cached per file version)"""
+        key = (str(image_path), image_path.stat().st_mtime)
+        cached = self._exif_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+        
         metadata = {
             'filename': image_path.name,
             'path': str(image_path.relative_to(SCRIPT_DIR)),
@@ -105,35 +316,105 @@ class PhotoAnalyzer:
         }
         
         try:
-            image = Image.open(image_path)
-            exif_data = image._getexif()
-            
-            if exif_data:
-                for tag_id, value in exif_data.items():
-                    tag = TAGS.get(tag_id, tag_id)
-                    
-                    # GPS handling
-                    if tag == "GPSInfo":
-                        gps_data = {}
-                        for gps_tag_id in value:
-                            gps_tag = GPSTAGS.get(gps_tag_id, gps_tag_id)
-                            gps_data[gps_tag] = value[gps_tag_id]
-                        metadata['gps'] = gps_data
-                    else:
+            with Image.open(image_path) as image:
+                exif = image.getexif()
+                
+                for ifd, tag_ids in ((exif, EXIF_MAIN_TAGS), (exif.get_ifd(IFD.Exif), EXIF_SUB_TAGS)):
+                    for tag_id in tag_ids:
+                        value = ifd.get(tag_id)
+                        if value is None:
+                            continue
                         # Convert datetime
                         if isinstance(value, bytes):
                             value = value.decode(errors='ignore')
-                        metadata[tag] = str(value) if not isinstance(value, (str, int, float)) else value
-                        
-            # Image dimensions
-            metadata['dimensions'] = f"{image.width}x{image.height}"
+                        metadata[tag_id.name] = str(value) if not isinstance(value, (str, int, float)) else value
+                
+                # GPS handling
+                gps_info = exif.get_ifd(IFD.GPSInfo)
+                if gps_info:
+                    metadata['gps'] = {GPSTAGS.get(tag_id, tag_id): value for tag_id, value in gps_info.items()}
+                
+                # Image dimensions
+                metadata['dimensions'] = f"{image.width}x{image.height}"
             
         except Exception as e:
             metadata['exif_error'] = str(e)
             
-        return metadata
+        self._exif_cache[key] = metadata
+        return dict(metadata)
+    
+    def _encode_image(self, image_path: Path, prefetch: bool = True) -> asyncio.Future:
+        """Starts encoding the image in the process pool (or returns the pending/completed encoding)
+        
+        Args:
+            image_path: Image path
+            prefetch: If True, also starts encoding the next PREFETCH_WINDOW images of the run
+        """
+        key = (str(image_path), image_path.stat().st_mtime)
+        future = self._encoded_images.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._pool, _prepare_image_bytes, str(image_path))
+            self._encoded_images[key] = future
+            if len(self._encoded_images) > IMAGE_MEMO_SIZE:
+                self._encoded_images.popitem(last=False)
+        else:
+            self._encoded_images.move_to_end(key)
+        
+        if prefetch and image_path in self._prefetch_index:
+            start = self._prefetch_index[image_path] + 1
+            for next_path in self._prefetch_order[start:start + PREFETCH_WINDOW]:
+                self._encode_image(next_path, prefetch=False)
+        return future
+    
+    async def _throttle(self):
+        """Waits until the minimum interval since the previous request has elapsed"""
+        if not self._min_interval:
+            return
+        async with self._rate_lock:
+            elapsed = time.monotonic() - self._last_dispatch
+            if elapsed < self._min_interval:
+                await asyncio.sleep(self._min_interval - elapsed)
+            self._last_dispatch = time.monotonic()
+    
+    async def _do_post(self, payload: Dict[str, Any]) -> Tuple[int, str]:
+        """Sends a streaming chat request, retrying transient failures with exponential backoff
+        
+        Returns the status code together with the accumulated message content
+        (or the error body for non-200 responses). On the last attempt the
+        error response (or exception) is passed on to the caller.
+        """
+        # Serialize once with orjson: it writes bytes directly, avoiding the
+        # intermediate str copy of the (large) base64 image data
+        body = orjson.dumps(payload)
+        
+        for attempt in range(RETRY_ATTEMPTS):
+            last_attempt = attempt == RETRY_ATTEMPTS - 1
+            await self._throttle()
+            try:
+                async with self.client.stream(
+                    'POST',
+                    'http://localhost:11434/api/chat',
+                    content=body,
+                    headers={'Content-Type': 'application/json'},
+                    timeout=120
+                ) as response:
+                    if response.status_code == 200:
+                        return response.status_code, await _read_chat_stream(response)
+                    if response.status_code not in RETRYABLE_STATUS_CODES or last_attempt:
+                        await response.aread()
+                        return response.status_code, response.text
+                reason = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                if last_attempt:
+                    raise
+                reason = type(e).__name__
+            
+            wait = min(RETRY_MAX_WAIT, RETRY_BASE_WAIT * 2 ** attempt)
+            print(f"  Ollama error ({reason}), retrying in {wait}s...")
+            await asyncio.sleep(wait)
     
-    def call_ollama(self, image_path: Path, prompt_type: str, use_thinking: bool = False, custom_prompt: str = None) -> Dict[str, Any]:
+    async def call_ollama(self, image_path: Path, prompt_type: str, use_thinking: bool = False, custom_prompt: str = None) -> Dict[str, Any]:
         """Calls Ollama API to analyze the image
         
         Args:
@@ -143,17 +424,39 @@ class PhotoAnalyzer:
             custom_prompt: Custom prompt (overrides prompt_type)
         """
         print(f"  Analyzing {image_path.name}...")
+        return await self._call_ollama_images([image_path], prompt_type, use_thinking, custom_prompt)
+    
+    async def call_ollama_multi(self, image_paths: List[Path], prompt: str, use_thinking: bool = False) -> Dict[str, Any]:
+        """Calls Ollama API with several images in a single message
         
+        Args:
+            image_paths: Image paths (at most GROUP_MAX_IMAGES are sent)
+            prompt: Prompt referring to the whole set of images
+            use_thinking: If True, allows the model to reason
+        """
+        image_paths = image_paths[:GROUP_MAX_IMAGES]
+        print(f"  Analyzing {', '.join(p.name for p in image_paths)} together...")
+        result = await self._call_ollama_images(image_paths, 'group', use_thinking, custom_prompt=prompt)
+        # Record which images the model actually saw
+        result['images'] = [str(p.relative_to(SCRIPT_DIR)) for p in image_paths]
+        return result
+    
+    async def _call_ollama_images(self, image_paths: List[Path], prompt_type: str, use_thinking: bool, custom_prompt: str = None) -> Dict[str, Any]:
+        """Sends one chat message with the given images (see call_ollama)"""
         try:
-            # Read the image and convert to base64
-            with open(image_path, 'rb') as img_file:
-                image_data = base64.b64encode(img_file.read()).decode('utf-8')
+            # Resize the images and convert to base64 (memoized)
+            images_data = await asyncio.gather(*[self._encode_image(p) for p in image_paths])
             
             # Determine which prompt to use
             if custom_prompt:
                 prompt = custom_prompt
+                content = self._apply_thinking_mode(custom_prompt, use_thinking)
+            elif (prompt_type, use_thinking) in self._effective_prompts:
+                prompt = self.model_config["prompts"][prompt_type]
+                content = self._effective_prompts[(prompt_type, use_thinking)]
             else:
-                prompt = self.model_config["prompts"].get(prompt_type, "Describe this image.")
+                prompt = "Describe this image."
+                content = self._apply_thinking_mode(prompt, use_thinking)
             
             # Prepare the API payload
             payload = {
@@ -161,55 +464,52 @@ class PhotoAnalyzer:
                 "messages": [
                     {
                         "role": "user",
-                        "content": prompt,
-                        "images": [image_data]
+                        "content": content,
+                        "images": images_data
                     }
                 ],
-                "stream": False,
+                "stream": True,
+                "keep_alive": OLLAMA_KEEP_ALIVE,
                 "options": {
                     "temperature": self.model_config["temperature"],
                 }
             }
             
-            # If we don't want thinking mode, specify it in the prompt (only for some models)
-            if not use_thinking and "qwen" in self.model_name.lower():
-                payload["messages"][0]["content"] = "Answer directly without showing your reasoning process. " + prompt
+            # Skip the API call if these images were already analyzed with the same prompt
+            key_parts = [
+                self.model_name,
+                self.model_digest,
+                orjson.dumps(payload["options"], option=orjson.OPT_SORT_KEYS).decode('utf-8'),
+                content,
+                *images_data
+            ]
+            cache_key = hashlib.sha256("\0".join(key_parts).encode('utf-8')).hexdigest()
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return cached
             
             # Call the API
-            response = requests.post(
-                'http://localhost:11434/api/chat',
-                json=payload,
-                timeout=120
-            )
+            status_code, content = await self._do_post(payload)
             
-            if response.status_code != 200:
+            if status_code != 200:
                 return {
                     'success': False,
-                    'error': f'HTTP {response.status_code}: {response.text}',
+                    'error': f'HTTP {status_code}: {content}',
                     'prompt': prompt
                 }
             
-            # Parse the JSON response
-            result = response.json()
-            
-            # Extract response content
-            if 'message' in result and 'content' in result['message']:
-                return {
-                    'success': True,
-                    'response': result['message']['content'].strip(),
-                    'prompt': prompt
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': f'Unexpected response format: {result}',
-                    'prompt': prompt
-                }
+            analysis = {
+                'success': True,
+                'response': content.strip(),
+                'prompt': prompt
+            }
+            self._cache_put(cache_key, analysis)
+            return analysis
             
-        except requests.Timeout:
+        except httpx.TimeoutException:
             return {
                 'success': False,
-                'error': 'Request timeout (>120s)',
+                'error': 'Request timeout (no data from Ollama for 120s)',
                 'prompt': custom_prompt or self.model_config["prompts"].get(prompt_type, "")
             }
         except Exception as e:
@@ -221,24 +521,40 @@ class PhotoAnalyzer:
     
     def get_images(self) -> List[Path]:
         """Gets the list of images to process"""
-        extensions = ['.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG']
-        images = []
-        for ext in extensions:
-            images.extend(self.photo_dir.glob(f'*{ext}'))
+        # Single directory scan, matching extensions case-insensitively
+        extensions = {'.jpg', '.jpeg', '.png'}
+        with os.scandir(self.photo_dir) as entries:
+            images = [
+                Path(entry.path) for entry in entries
+                if entry.is_file() and Path(entry.name).suffix.lower() in extensions
+            ]
         
         return sorted(images)
     
-    def analyze_photo_group(self, images: List[Path], context_hint: str = None) -> Dict[str, Any]:
+    async def _bounded(self, coro):
+        """Runs a coroutine while holding the concurrency semaphore"""
+        async with self.sem:
+            return await coro
+    
+    async def analyze_photo_group(self, images: List[Path], context_hint: str = None) -> Dict[str, Any]:
         """Analyzes a group of photos to find common/contextual tags"""
         
-        # First get individual tags for each photo
-        individual_results = []
-        for img in images:
-            result = self.call_ollama(img, 'tags', use_thinking=False)
-            individual_results.append({
+        # First get individual tags for each photo (already cached by the
+        # quick analysis; skipped when the cache is disabled, since every
+        # photo would need a new inference)
+        tag_results = []
+        if self.use_cache:
+            tag_results = await asyncio.gather(*[
+                self._bounded(self.call_ollama(img, 'tags', use_thinking=False))
+                for img in images
+            ])
+        individual_results = [
+            {
                 'image': str(img.relative_to(SCRIPT_DIR)),
                 'tags': result
-            })
+            }
+            for img, result in zip(images, tag_results)
+        ]
         
         # Then analyze the group as a whole
         # Prepare a prompt with context hint if provided
@@ -249,9 +565,9 @@ Based on this context and the images provided, output ONLY a comma-separated lis
         else:
             group_prompt = self.model_config["prompts"]["group"]
         
-        # For group analysis, use the first image as representative
-        # (in a more advanced system, multiple images could be sent)
-        group_result = self.call_ollama(images[0], 'group', custom_prompt=group_prompt)
+        # Send a sample of the group in a single request, so the model
+        # sees the images together in one inference
+        group_result = await self._bounded(self.call_ollama_multi(images, group_prompt))
         
         return {
             'context_hint': context_hint,
@@ -260,7 +576,7 @@ Based on this context and the images provided, output ONLY a comma-separated lis
             'images_count': len(images)
         }
     
-    def run_comprehensive_test(self):
+    async def run_comprehensive_test(self):
         """Runs a comprehensive series of tests on the system"""
         
         # Get image list
@@ -272,6 +588,16 @@ Based on this context and the images provided, output ONLY a comma-separated lis
         
         print(f"\nFound {len(images)} images to analyze")
         
+        # Don't allow more concurrent requests than there are images
+        self.sem = asyncio.Semaphore(min(len(images), OLLAMA_NUM_PARALLEL))
+        
+        # Encode images a few at a time ahead of their requests, so CPU work on
+        # later images overlaps with inference on earlier ones
+        self._prefetch_order = images
+        self._prefetch_index = {img: i for i, img in enumerate(images)}
+        for img in images[:PREFETCH_WINDOW]:
+            self._encode_image(img, prefetch=False)
+        
         # Prepare results structure
         all_results = {
             'timestamp': datetime.now().isoformat(),
@@ -285,42 +611,51 @@ Based on this context and the images provided, output ONLY a comma-separated lis
         print("\n" + "="*60)
         print("TEST 1: Detailed analysis (first 3 photos)")
         print("="*60)
-        all_results['tests']['detailed_single'] = []
         
-        for img in images[:3]:
+        async def detailed_analysis(img: Path) -> Dict[str, Any]:
             print(f"\n  === {img.name} ===")
-            result = {
+            generic_tags, detailed_tags, brief, description = await asyncio.gather(
+                self._bounded(self.call_ollama(img, 'tags', use_thinking=False)),
+                self._bounded(self.call_ollama(img, 'detailed_tags', use_thinking=False)),
+                self._bounded(self.call_ollama(img, 'brief', use_thinking=False)),
+                self._bounded(self.call_ollama(img, 'description', use_thinking=True))
+            )
+            return {
                 'image': str(img.relative_to(SCRIPT_DIR)),
                 'metadata': self.extract_exif(img),
                 'analyses': {
-                    'generic_tags': self.call_ollama(img, 'tags', use_thinking=False),
-                    'detailed_tags': self.call_ollama(img, 'detailed_tags', use_thinking=False),
-                    'brief_description': self.call_ollama(img, 'brief', use_thinking=False),
-                    'full_description': self.call_ollama(img, 'description', use_thinking=True)
+                    'generic_tags': generic_tags,
+                    'detailed_tags': detailed_tags,
+                    'brief_description': brief,
+                    'full_description': description
                 }
             }
-            all_results['tests']['detailed_single'].append(result)
+        
+        all_results['tests']['detailed_single'] = await asyncio.gather(
+            *[detailed_analysis(img) for img in images[:3]]
+        )
         
         # TEST 2: Quick analysis of all photos
         print("\n" + "="*60)
         print("TEST 2: Quick analysis of all photos")
         print("="*60)
-        all_results['tests']['quick_all'] = []
         
-        for img in images:
-            print(f"\n  Analyzing {img.name}...")
-            result = {
+        async def quick_analysis(img: Path) -> Dict[str, Any]:
+            return {
                 'image': str(img.relative_to(SCRIPT_DIR)),
                 'metadata': self.extract_exif(img),
-                'tags': self.call_ollama(img, 'tags', use_thinking=False)
+                'tags': await self._bounded(self.call_ollama(img, 'tags', use_thinking=False))
             }
-            all_results['tests']['quick_all'].append(result)
+        
+        all_results['tests']['quick_all'] = await asyncio.gather(
+            *[quick_analysis(img) for img in images]
+        )
         
         # TEST 3: Group analysis without context hints
         print("\n" + "="*60)
         print("TEST 3: Group analysis (without hints)")
         print("="*60)
-        group_result_no_context = self.analyze_photo_group(images[:7])
+        group_result_no_context = await self.analyze_photo_group(images[:7])
         all_results['tests']['group_no_context'] = group_result_no_context
         
         # TEST 4: Group analysis with context hints
@@ -334,12 +669,11 @@ Based on this context and the images provided, output ONLY a comma-separated lis
         context = input().strip()
         
         if context:
-            group_result_with_context = self.analyze_photo_group(images[7:], context)
+            group_result_with_context = await self.analyze_photo_group(images[7:], context)
             all_results['tests']['group_with_context'] = group_result_with_context
         
         # Save results
-        model_safe_name = self.model_name.replace(':', '_').replace('/', '_')
-        output_file = self.results_dir / f"test_results_{model_safe_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        output_file = self.results_dir / f"test_results_{self.model_safe_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(all_results, f, indent=2, ensure_ascii=False)
         
@@ -386,6 +720,16 @@ Based on this context and the images provided, output ONLY a comma-separated lis
             group_tags = results['tests']['group_with_context']['group_analysis'].get('response', 'N/A')
             print(f"  Common tags: {group_tags[:100]}...")
 
+def positive_float(value: str) -> float:
+    """argparse type for finite numbers that must be greater than 0"""
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid number: '{value}'")
+    if not (math.isfinite(number) and number > 0):
+        raise argparse.ArgumentTypeError(f"must be a finite number greater than 0 (got {value})")
+    return number
+
 def main():
     """Main entry point"""
     # Parse arguments
@@ -397,6 +741,8 @@ Usage examples:
   %(prog)s                           # Use default model (qwen3-vl:8b)
   %(prog)s --model llava              # Use LLaVA
   %(prog)s --compare                  # Compare all models
+  %(prog)s --rps 0.5                  # At most one request every 2 seconds
+  %(prog)s --no-cache                 # Ignore responses cached by earlier runs
   %(prog)s --list                     # List available models
         """
     )
@@ -413,6 +759,18 @@ Usage examples:
         help='Compare all available models'
     )
     
+    parser.add_argument(
+        '--rps',
+        type=positive_float,
+        help='Maximum requests per second sent to Ollama (default: no limit)'
+    )
+    
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Ignore cached responses (fresh responses still update the cache)'
+    )
+    
     parser.add_argument(
         '--list', '-l',
         action='store_true',
@@ -438,76 +796,90 @@ Usage examples:
     print("AI PHOTO TAGGING SYSTEM TEST")
     print("="*60)
     
-    # Check that Ollama is available
-    try:
-        response = requests.get('http://localhost:11434/api/tags', timeout=5)
-        if response.status_code != 200:
-            print(f"\nERROR: Ollama not responding correctly (status {response.status_code})")
+    asyncio.run(run_tests(args))
+
+async def run_tests(args: argparse.Namespace):
+    """Checks Ollama and the photos, then runs the tests for the selected models"""
+    # A single HTTP client is shared by the availability probe and all
+    # analyzers, so the probe's connection is reused for the first requests
+    async with create_client() as client:
+        # Check that Ollama is available
+        try:
+            response = await client.get('http://localhost:11434/api/tags', timeout=5)
+            if response.status_code != 200:
+                print(f"\nERROR: Ollama not responding correctly (status {response.status_code})")
+                print("Make sure Ollama is running: ollama serve")
+                return
+            
+            # Get list of available models
+            tags_data = response.json()
+            available_models = []
+            model_digests = {}
+            if 'models' in tags_data:
+                available_models = [m.get('name', '') for m in tags_data['models']]
+                model_digests = {m.get('name', ''): m.get('digest', '') for m in tags_data['models']}
+                
+        except httpx.HTTPError as e:
+            print(f"\nERROR: Cannot connect to Ollama: {e}")
             print("Make sure Ollama is running: ollama serve")
             return
         
-        # Get list of available models
-        tags_data = response.json()
-        available_models = []
-        if 'models' in tags_data:
-            available_models = [m.get('name', '') for m in tags_data['models']]
+        # Check that photo directory exists
+        if not PHOTO_DIR.exists():
+            print(f"\nERROR: Directory {PHOTO_DIR} not found!")
+            print(f"Create the directory and insert test photos:")
+            print(f"  mkdir -p {PHOTO_DIR}")
+            return
+        
+        # Determine which model(s) to use
+        models_to_test = []
+        
+        if args.compare:
+            # Test all available models
+            print("\nCOMPARE mode: will test all available models\n")
+            models_to_test = list(MODEL_CONFIGS.keys())
+        elif args.model:
+            # Use specified model
+            models_to_test = [args.model]
+        else:
+            # Use default
+            models_to_test = [DEFAULT_MODEL]
+        
+        # Check that models are installed
+        for model_key in models_to_test:
+            model_name = MODEL_CONFIGS[model_key]['name']
+            # Check if model is available
+            model_found = any(model_name in am for am in available_models)
+            if not model_found:
+                print(f"\nWARNING: Model {model_name} not found!")
+                print(f"Run: ollama pull {model_name}")
+                print(f"Skipping this model...\n")
+                models_to_test.remove(model_key)
+        
+        if not models_to_test:
+            print("\nERROR: No models available for testing!")
+            return
+        
+        # Run tests for each model
+        for model_key in models_to_test:
+            if len(models_to_test) > 1:
+                print("\n" + "="*60)
+                print(f"TESTING: {model_key}")
+                print("="*60 + "\n")
             
-    except requests.RequestException as e:
-        print(f"\nERROR: Cannot connect to Ollama: {e}")
-        print("Make sure Ollama is running: ollama serve")
-        return
-    
-    # Check that photo directory exists
-    if not PHOTO_DIR.exists():
-        print(f"\nERROR: Directory {PHOTO_DIR} not found!")
-        print(f"Create the directory and insert test photos:")
-        print(f"  mkdir -p {PHOTO_DIR}")
-        return
-    
-    # Determine which model(s) to use
-    models_to_test = []
-    
-    if args.compare:
-        # Test all available models
-        print("\nCOMPARE mode: will test all available models\n")
-        models_to_test = list(MODEL_CONFIGS.keys())
-    elif args.model:
-        # Use specified model
-        models_to_test = [args.model]
-    else:
-        # Use default
-        models_to_test = [DEFAULT_MODEL]
-    
-    # Check that models are installed
-    for model_key in models_to_test:
-        model_name = MODEL_CONFIGS[model_key]['name']
-        # Check if model is available
-        model_found = any(model_name in am for am in available_models)
-        if not model_found:
-            print(f"\nWARNING: Model {model_name} not found!")
-            print(f"Run: ollama pull {model_name}")
-            print(f"Skipping this model...\n")
-            models_to_test.remove(model_key)
-    
-    if not models_to_test:
-        print("\nERROR: No models available for testing!")
-        return
-    
-    # Run tests for each model
-    for model_key in models_to_test:
-        if len(models_to_test) > 1:
-            print("\n" + "="*60)
-            print(f"TESTING: {model_key}")
-            print("="*60 + "\n")
-        
-        # Create analyzer and run tests
-        analyzer = PhotoAnalyzer(PHOTO_DIR, RESULTS_DIR, model_key)
-        analyzer.run_comprehensive_test()
-        
-        if len(models_to_test) > 1:
-            print(f"\n{'='*60}")
-            print(f"Completed test with {model_key}")
-            print(f"{'='*60}\n")
+            # Create analyzer and run tests (the installed model's digest is part
+            # of the cache key, so re-pulled models don't reuse old responses)
+            model_name = MODEL_CONFIGS[model_key]['name']
+            model_digest = next((d for name, d in model_digests.items() if model_name in name), "")
+            async with PhotoAnalyzer(PHOTO_DIR, RESULTS_DIR, model_key, rps=args.rps, client=client,
+                                     use_cache=not args.no_cache, model_digest=model_digest) as analyzer:
+                await analyzer.warmup()
+                await analyzer.run_comprehensive_test()
+            
+            if len(models_to_test) > 1:
+                print(f"\n{'='*60}")
+                print(f"Completed test with {model_key}")
+                print(f"{'='*60}\n")
 
 if __name__ == "__main__":
     main()